@@ -5,26 +5,38 @@ api.py
 Este archivo expone la API REST del SOW Compliance Agent usando FastAPI.
 
 Se apoya en la lógica que ya se tiene en:
-- app/main.py   → process_sow_record, email_chain, send_email, config de correo
+- app/main.py   → email_chain, helpers de prompt/correo (send_email_async), config de correo
 - app/database.py → init_db, get_db (manejo de SQLite)
 - app/models.py → modelo ORM SOW
+- app/email_utils.py → payload del SOW para el prompt y parseo de la respuesta del LLM
 """
 
-from typing import List
+from typing import List, Tuple
 
-import json
+import os
+import time
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 # Imports del paquete local "app"
 from .database import init_db, get_db
 from .models import SOW
+from .crud import bulk_upsert_sows
+from .responses import ORJSONResponse
+from .schemas import UploadResponse, AnalyzeResponse, GenerateEmailResponse
+from .email_utils import sow_to_prompt_json, response_content, parse_email_response
 from .main import (
-    process_sow_record,  # lógica que guarda/actualiza y dispara correo si aplica
-    email_chain,         # cadena de LangChain + Ollama ya configurada
-    send_email,          # helper para enviar correo vía SMTP
-    ALERT_EMAIL_TO,      # correo de destino configurado en config.yaml / env
+    apply_default_status,      # asigna status flagged/healthy si no viene
+    alert_for,                 # decide si un SOW nuevo dispara alerta
+    asend_alert_emails,        # genera (LLM en batch) y envía las alertas
+    email_chain,               # cadena de LangChain + Ollama ya configurada
+    send_email_async,          # envío vía conexión SMTP persistente (aiosmtplib)
+    close_smtp_client,         # cierra esa conexión al apagar el API
+    warmup_llm,                # precarga el modelo en Ollama
+    ALERT_EMAIL_TO,            # correo de destino configurado en config.yaml / env
 )
 
 # ---------------------------------------------------------------------------
@@ -38,22 +50,70 @@ app = FastAPI(
         "API para analizar SOWs, calcular riesgo, persistirlos en base de datos "
         "y disparar alertas automáticas por correo."
     ),
+    # orjson en lugar del json estándar para todas las respuestas
+    default_response_class=ORJSONResponse,
 )
 
 
+# Columnas que alimentan el dashboard (/analyze), con los nombres que espera
+SOW_DASHBOARD_COLUMNS = (
+    SOW.sow_id,
+    SOW.contract_id,
+    SOW.sow_title.label("title"),
+    SOW.status,                                   # flagged / healthy
+    SOW.risk,                                     # high / medium / low
+    SOW.days_before_expiration,
+    SOW.active_sow_workers.label("active_workers"),
+    SOW.latest_maximum_budget,
+    SOW.currency,
+    SOW.supplier,
+    SOW.business_unit,
+    SOW.primary_lob,
+    SOW.sow_owner,
+)
+
+
+# Caché en memoria del body de /analyze: el dashboard lo consulta cada pocos
+# segundos y entre uploads el resultado no cambia.
+ANALYZE_CACHE_TTL = float(os.getenv("ANALYZE_CACHE_TTL", 5))  # segundos
+
+# (momento en que se generó, versión de datos, body JSON serializado)
+_analyze_cache: Tuple[float, int, bytes] | None = None
+# Se incrementa en cada /upload para invalidar la caché
+_cache_version = 0
+
+
 # ---------------------------------------------------------------------------
 # Eventos de ciclo de vida
 # ---------------------------------------------------------------------------
 
 @app.on_event("startup")
-def on_startup() -> None:
+async def on_startup() -> None:
     """
     Evento que se ejecuta cuando arranca la API.
 
-    Aquí inicializamos la base de datos (crea tablas si no existen).
+    Aquí inicializamos la base de datos (crea tablas si no existen) y
+    precargamos el modelo en Ollama para que la primera alerta no pague
+    la latencia de carga.
     """
     init_db()
 
+    try:
+        await warmup_llm()
+    except Exception as exc:
+        # Ollama puede no estar listo todavía: el API arranca igual
+        print(f"LLM warm-up failed: {exc}")
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    """
+    Evento que se ejecuta cuando se detiene la API.
+
+    Cierra la conexión SMTP persistente.
+    """
+    await close_smtp_client()
+
 
 # ---------------------------------------------------------------------------
 # Endpoints
@@ -69,21 +129,55 @@ def health() -> dict:
     return {"status": "ok"}
 
 
-@app.post("/upload")
-def upload_sows(
+def _persist_sows(
+    db: Session, sows: List[dict]
+) -> Tuple[List[Tuple[str, str]], List[Tuple[str, dict]]]:
+    """
+    Inserta/actualiza todos los SOWs recibidos en un único upsert masivo
+    (trabajo síncrono de SQLAlchemy).
+
+    Se ejecuta completo en el threadpool para no bloquear el event loop.
+    Devuelve los pares (sow_id, "created" | "updated") y, para cada SOW
+    NUEVO de alto riesgo/flagged, el input del prompt construido con los
+    datos con los que se creó.
+    """
+    results, created = bulk_upsert_sows(
+        db, [apply_default_status(raw_sow) for raw_sow in sows]
+    )
+    # Una sola transacción (un solo fsync) por request
+    db.commit()
+
+    alerts: List[Tuple[str, dict]] = []
+    for sow_row in created:
+        alert = alert_for(sow_row, "created")
+        if alert is not None:
+            alerts.append(alert)
+
+    return results, alerts
+
+
+@app.post("/upload", response_model=UploadResponse)
+async def upload_sows(
     sows: List[dict],          # lista de registros SOW crudos en formato JSON
+    background: BackgroundTasks,
     db: Session = Depends(get_db),
-) -> dict:
+) -> ORJSONResponse:
     """
     Recibe un listado de SOWs en formato JSON (como vienen del CSV o de otro sistema),
-    y para cada uno:
+    y los procesa en tres fases:
+
+    1. Persistencia (en threadpool): normaliza risk/status e inserta/actualiza
+       todos los SOWs en la tabla SOW con un único upsert masivo.
+
+    2. LLM: para los SOWs NUEVOS y de alto riesgo/flagged genera todos los
+       correos de forma concurrente con `email_chain.abatch`.
+
+    3. SMTP: envía los correos en paralelo con `asyncio.gather`.
 
-    1. Llama a `process_sow_record` (app/main.py), que:
-       - normaliza risk/status,
-       - inserta/actualiza en la tabla SOW,
-       - si es NUEVO y de alto riesgo/flagged, llama al LLM y envía correo.
+    Las fases 2 y 3 corren como background task: la respuesta sale en cuanto
+    los SOWs quedan guardados, sin esperar al LLM ni al SMTP.
 
-    2. Cuenta cuántos fueron creados vs actualizados.
+    Devuelve cuántos fueron creados vs actualizados.
 
     Ejemplo de body (lista con 1 elemento):
 
@@ -111,65 +205,92 @@ def upload_sows(
     updated = 0
     sow_ids: List[str] = []
 
-    for raw_sow in sows:
-        # process_sow_record devuelve (objeto_SOW, "created" | "updated")
-        sow_obj, action = process_sow_record(db, raw_sow)
-        sow_ids.append(sow_obj.sow_id)
+    global _cache_version
+
+    # 1. Persistencia: cada resultado es (sow_id, "created" | "updated")
+    results, alerts = await run_in_threadpool(_persist_sows, db, sows)
+    _cache_version += 1  # los datos cambiaron: invalida la caché de /analyze
+
+    for sow_id, action in results:
+        sow_ids.append(sow_id)
 
         if action == "created":
             created += 1
         else:
             updated += 1
 
-    return {
-        "message": "Dataset procesado correctamente",
-        "total_received": len(sows),
-        "created": created,
-        "updated": updated,
-        "sow_ids": sow_ids,
-    }
+    # 2-3. Generar los correos con el LLM en batch y enviarlos en paralelo,
+    # después de responder (los inputs del prompt ya están armados, no se
+    # vuelve a leer la base de datos)
+    if alerts:
+        background.add_task(asend_alert_emails, alerts)
 
+    response = UploadResponse(
+        message="Dataset procesado correctamente",
+        total_received=len(sows),
+        created=created,
+        updated=updated,
+        sow_ids=sow_ids,
+    )
+    # ORJSONResponse directo: FastAPI no vuelve a pasar por jsonable_encoder
+    return ORJSONResponse(content=response.model_dump(mode="json"))
 
-@app.get("/analyze")
-def analyze_sows(db: Session = Depends(get_db)) -> dict:
+
+def _fetch_dashboard_rows(db: Session) -> list:
+    """
+    Filas Core (sin instancias ORM ni identity map), leídas en bloques de
+    1000 y convertidas a dict con las claves del dashboard: orjson serializa
+    los dict de forma nativa, sin pasar por el callback `default`.
+    """
+    stmt = select(*SOW_DASHBOARD_COLUMNS).execution_options(yield_per=1000)
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+
+@app.get("/analyze", response_model=AnalyzeResponse)
+async def analyze_sows(db: Session = Depends(get_db)) -> ORJSONResponse:
     """
     Devuelve todos los SOWs almacenados con su nivel de riesgo y campos clave.
 
     Este endpoint sirve como fuente de datos para el dashboard.
+
+    El body serializado se cachea `ANALYZE_CACHE_TTL` segundos o hasta el
+    siguiente /upload.
     """
-    sows = db.query(SOW).all()
-
-    items: List[dict] = []
-    for sow in sows:
-        items.append(
-            {
-                "sow_id": sow.sow_id,
-                "contract_id": sow.contract_id,
-                "title": sow.sow_title,
-                "status": sow.status,                    # flagged / healthy
-                "risk": sow.risk,                        # high / medium / low
-                "days_before_expiration": sow.days_before_expiration,
-                "active_workers": sow.active_sow_workers,
-                "latest_maximum_budget": sow.latest_maximum_budget,
-                "currency": sow.currency,
-                "supplier": sow.supplier,
-                "business_unit": sow.business_unit,
-                "primary_lob": sow.primary_lob,
-                "sow_owner": sow.sow_owner,
-            }
-        )
-
-    return {
-        "total": len(items),
-        "items": items,
-    }
-
-
-@app.post("/generate-email/{sow_id}")
-def generate_email(
+    global _analyze_cache
+
+    now = time.monotonic()
+    cached = _analyze_cache
+    if (
+        cached is not None
+        and cached[1] == _cache_version
+        and now - cached[0] < ANALYZE_CACHE_TTL
+    ):
+        return Response(content=cached[2], media_type="application/json")
+
+    # Versión leída ANTES de consultar: si entra un /upload mientras tanto,
+    # este resultado queda invalidado
+    version = _cache_version
+
+    # La lectura de SQLite es bloqueante: va al threadpool
+    rows = await run_in_threadpool(_fetch_dashboard_rows, db)
+
+    # Devolvemos la respuesta directamente para saltar jsonable_encoder y la
+    # validación fila por fila (response_model solo documenta el esquema)
+    response = ORJSONResponse(
+        content={
+            "total": len(rows),
+            "items": rows,
+        }
+    )
+    _analyze_cache = (now, version, response.body)
+    return response
+
+
+@app.post("/generate-email/{sow_id}", response_model=GenerateEmailResponse)
+async def generate_email(
     sow_id: str,
     db: Session = Depends(get_db),
-) -> dict:
+) -> ORJSONResponse:
     """
     Genera (con el LLM) y envía un correo de alerta para un SOW específico,
     aunque ya exista o no sea "nuevo".
@@ -177,70 +298,43 @@ def generate_email(
     Flujo:
 
     1. Busca el SOW en la base de datos por `sow_id`.
-    2. Construye un JSON con los campos relevantes.
-    3. Llama a `email_chain.invoke({"sow_json": sow_json})`.
+    2. Construye un JSON con los campos relevantes (`sow_to_prompt_json`).
+    3. Llama a `email_chain.ainvoke({"sow_json": sow_json})`.
     4. Intenta parsear la respuesta como JSON:
        {
          "subject": "...",
          "body": "..."
        }
        Si el modelo no devuelve JSON perfecto, usa el texto crudo.
-    5. Llama a `send_email(subject, body, ALERT_EMAIL_TO)`.
+    5. Llama a `send_email_async(subject, body, ALERT_EMAIL_TO)`.
     """
-    sow_obj: SOW | None = db.query(SOW).filter(SOW.sow_id == sow_id).first()
+    sow_obj: SOW | None = await run_in_threadpool(
+        lambda: db.query(SOW).filter(SOW.sow_id == sow_id).first()
+    )
     if sow_obj is None:
         raise HTTPException(status_code=404, detail="SOW no encontrado")
 
-    # Construimos un diccionario con los datos del SOW
-    sow_payload = {
-        "sow_id": sow_obj.sow_id,
-        "sow_title": sow_obj.sow_title,
-        "sow_status": sow_obj.sow_status,
-        "risk": sow_obj.risk,
-        "status": sow_obj.status,  # flagged / healthy
-        "supplier": sow_obj.supplier,
-        "business_unit": sow_obj.business_unit,
-        "primary_lob": sow_obj.primary_lob,
-        "sow_owner": sow_obj.sow_owner,
-        "start_date": sow_obj.start_date.isoformat() if sow_obj.start_date else None,
-        "end_date": sow_obj.end_date.isoformat() if sow_obj.end_date else None,
-        "days_before_expiration": sow_obj.days_before_expiration,
-        "active_sow_workers": sow_obj.active_sow_workers,
-        "latest_maximum_budget": sow_obj.latest_maximum_budget,
-        "currency": sow_obj.currency,
-    }
-
-    # Convertimos el dict a JSON string para pasarlo al prompt
-    sow_json = json.dumps(sow_payload, default=str)
+    # Convertimos los datos del SOW a JSON string para pasarlo al prompt
+    sow_json = sow_to_prompt_json(sow_obj)
 
     # Invocamos la cadena del LLM ya configurada en main.py
-    llm_response = email_chain.invoke({"sow_json": sow_json})
-
-    # Obtenemos el contenido (algunos modelos devuelven .content, otros un string)
-    try:
-        content = llm_response.content
-    except AttributeError:
-        content = str(llm_response)
-
-    # Intentamos parsear la respuesta como JSON con campos "subject" y "body"
-    try:
-        email_data = json.loads(content)
-        subject = email_data.get(
-            "subject",
-            f"[SOW Compliance] High Risk SOW {sow_obj.sow_id}",
-        )
-        body = email_data.get("body", content)
-    except json.JSONDecodeError:
-        # Si el modelo no devolvió JSON bien formado, usamos texto completo
-        subject = f"[SOW Compliance] High Risk SOW {sow_obj.sow_id}"
-        body = content
-
-    # Enviar el correo usando la función helper de main.py
-    send_email(subject=subject, body=body, to_email=ALERT_EMAIL_TO)
-
-    return {
-        "message": "Email generado y enviado",
-        "sow_id": sow_obj.sow_id,
-        "subject": subject,
-        "to": ALERT_EMAIL_TO,
-    }
+    llm_response = await email_chain.ainvoke({"sow_json": sow_json})
+
+    # Parseamos {"subject", "body"}; si el modelo no devuelve JSON perfecto,
+    # se usa el texto crudo
+    subject, body = parse_email_response(
+        response_content(llm_response),
+        sow_obj.sow_id,
+        fallback_subject=f"[SOW Compliance] High Risk SOW {sow_obj.sow_id}",
+    )
+
+    # Enviar el correo por la conexión SMTP persistente de main.py
+    await send_email_async(subject=subject, body=body, to_email=ALERT_EMAIL_TO)
+
+    response = GenerateEmailResponse(
+        message="Email generado y enviado",
+        sow_id=sow_obj.sow_id,
+        subject=subject,
+        to=ALERT_EMAIL_TO,
+    )
+    return ORJSONResponse(content=response.model_dump(mode="json"))
@@ -1,6 +1,9 @@
 # crud.py
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
 
 from .models import SOW
 from .schemas import CreateSOWRequest
@@ -26,12 +29,24 @@ KEY_MAPPING: Dict[str, str] = {
 }
 
 
+# Validates a whole batch of new SOWs in a single (Rust-backed) call
+_CREATE_BATCH_ADAPTER = TypeAdapter(List[CreateSOWRequest])
+
+# Precomputed once at import; normalize_sow_data runs once per SOW in /upload
+_MAPPING_ITEMS: Tuple[Tuple[str, str], ...] = tuple(KEY_MAPPING.items())
+
+# Rows per statement in bulk_upsert_sows: keeps every statement well under
+# SQLite's bound-parameter limit (~16 params per inserted row)
+UPSERT_CHUNK_SIZE = 500
+
+
+def _chunks(items: list, size: int = UPSERT_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 def normalize_sow_data(raw_dict: dict) -> dict:
-    normalized = {}
-    for key, value in raw_dict.items():
-        if key in KEY_MAPPING:
-            normalized[KEY_MAPPING[key]] = value
-    return normalized
+    return {dst: raw_dict[src] for src, dst in _MAPPING_ITEMS if src in raw_dict}
 
 
 def create_or_update_sow(
@@ -41,6 +56,7 @@ def create_or_update_sow(
     If sow_id exists in DB: update only risk & status.
     Otherwise: create a new SOW row.
     Returns (sow_obj, "created" | "updated").
+    Only flushes: the caller owns the transaction and commits once.
     """
     normalized = normalize_sow_data(raw_sow_dict)
 
@@ -56,14 +72,88 @@ def create_or_update_sow(
         if "status" in normalized:
             existing.status = normalized["status"]
 
-        db.commit()
-        db.refresh(existing)
+        db.flush()
         return existing, "updated"
 
     sow_request = CreateSOWRequest(**normalized)
     new_sow = SOW(**sow_request.model_dump())
 
     db.add(new_sow)
-    db.commit()
-    db.refresh(new_sow)
+    db.flush()  # assigns new_sow.id
     return new_sow, "created"
+
+
+def bulk_upsert_sows(
+    db: Session, raw_sow_dicts: List[dict]
+) -> Tuple[List[Tuple[str, str]], List[CreateSOWRequest]]:
+    """
+    Batch version of create_or_update_sow: SELECTs for the existing ids,
+    multi-row INSERT ... ON CONFLICT for the new SOWs and executemany UPDATE
+    (risk & status only) for the existing ones, each in chunks of
+    UPSERT_CHUNK_SIZE rows so large uploads stay under SQLite's
+    bound-parameter limit.
+
+    Returns ([(sow_id, "created" | "updated"), ...] in input order,
+    validated rows of the newly created SOWs).
+    Does not commit: the caller owns the transaction.
+    """
+    normalized_rows = [normalize_sow_data(raw) for raw in raw_sow_dicts]
+    if not all(row.get("sow_id") for row in normalized_rows):
+        raise ValueError("sow_id is required to create or update a SOW")
+
+    existing_ids = set()
+    for id_chunk in _chunks(list({row["sow_id"] for row in normalized_rows})):
+        existing_ids.update(
+            db.scalars(select(SOW.sow_id).where(SOW.sow_id.in_(id_chunk)))
+        )
+
+    results: List[Tuple[str, str]] = []
+    new_rows: Dict[str, dict] = {}
+    updates: List[dict] = []
+
+    for row in normalized_rows:
+        sow_id = row["sow_id"]
+        if sow_id in existing_ids or sow_id in new_rows:
+            # Missing risk/status keep the stored value (see COALESCE below)
+            updates.append(
+                {
+                    "b_sow_id": sow_id,
+                    "b_risk": row.get("risk"),
+                    "b_status": row.get("status"),
+                }
+            )
+            results.append((sow_id, "updated"))
+        else:
+            new_rows[sow_id] = row
+            results.append((sow_id, "created"))
+
+    created: List[CreateSOWRequest] = []
+    if new_rows:
+        created = _CREATE_BATCH_ADAPTER.validate_python(list(new_rows.values()))
+        # Plain dicts straight into the INSERT: no ORM instances / identity map
+        for row_chunk in _chunks(_CREATE_BATCH_ADAPTER.dump_python(created)):
+            insert_stmt = sqlite_insert(SOW).values(row_chunk)
+            db.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=["sow_id"],
+                    set_={
+                        "risk": insert_stmt.excluded.risk,
+                        "status": insert_stmt.excluded.status,
+                    },
+                )
+            )
+
+    if updates:
+        sow_table = SOW.__table__
+        update_stmt = (
+            update(sow_table)
+            .where(sow_table.c.sow_id == bindparam("b_sow_id"))
+            .values(
+                risk=func.coalesce(bindparam("b_risk"), sow_table.c.risk),
+                status=func.coalesce(bindparam("b_status"), sow_table.c.status),
+            )
+        )
+        for update_chunk in _chunks(updates):
+            db.execute(update_stmt, update_chunk)
+
+    return results, created
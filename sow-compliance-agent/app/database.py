@@ -1,5 +1,5 @@
 # database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./sows_status.db"
@@ -8,9 +8,25 @@ SQLALCHEMY_DATABASE_URL = "sqlite:///./sows_status.db"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
+    pool_size=10,
+    max_overflow=20,
 )
 
 
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _connection_record):
+    """
+    WAL lets /analyze reads proceed while /upload writes; the other pragmas
+    trade a little durability on power loss for fewer fsyncs.
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -30,10 +46,19 @@ def get_db():
         db.close()
 
 
+# Set once create_all has run in this process
+_SCHEMA_READY = False
+
+
 def init_db():
     """
     Import models and create tables.
-    Call this once on app startup.
+    Call this once on app startup; later calls in the same process are no-ops.
     """
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+
     from .models import SOW  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    _SCHEMA_READY = True
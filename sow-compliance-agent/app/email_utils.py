@@ -0,0 +1,72 @@
+# email_utils.py
+"""
+Helpers puros para el flujo de correos con el LLM:
+construir el payload de un SOW y parsear la respuesta del modelo.
+"""
+import orjson
+
+
+def build_sow_payload(sow_obj) -> dict:
+    """
+    Campos de un SOW que se le pasan al LLM.
+
+    Acepta cualquier objeto con los atributos del modelo SOW
+    (fila ORM o CreateSOWRequest).
+    """
+    return {
+        "sow_id": sow_obj.sow_id,
+        "sow_title": sow_obj.sow_title,
+        "sow_status": sow_obj.sow_status,
+        "risk": sow_obj.risk,
+        "status": sow_obj.status,  # flagged / healthy
+        "supplier": sow_obj.supplier,
+        "business_unit": sow_obj.business_unit,
+        "primary_lob": sow_obj.primary_lob,
+        "sow_owner": sow_obj.sow_owner,
+        "start_date": sow_obj.start_date,
+        "end_date": sow_obj.end_date,
+        "days_before_expiration": sow_obj.days_before_expiration,
+        "active_sow_workers": sow_obj.active_sow_workers,
+        "latest_maximum_budget": sow_obj.latest_maximum_budget,
+        "currency": sow_obj.currency,
+    }
+
+
+def sow_to_prompt_json(sow_obj) -> str:
+    """
+    Serializa el payload de un SOW para el prompt del LLM.
+
+    orjson serializa las fechas (datetime.date) de forma nativa; las claves
+    ordenadas hacen que payloads iguales produzcan el mismo prompt (cache hit).
+    """
+    return orjson.dumps(build_sow_payload(sow_obj), option=orjson.OPT_SORT_KEYS).decode()
+
+
+def response_content(llm_response) -> str:
+    """Texto de la respuesta del LLM (algunos modelos devuelven .content, otros un string)."""
+    try:
+        return llm_response.content
+    except AttributeError:
+        return str(llm_response)
+
+
+def parse_email_response(
+    content: str, sow_id: str, fallback_subject: str | None = None
+) -> tuple[str, str]:
+    """
+    Parsea la respuesta del LLM como JSON {"subject": ..., "body": ...}.
+
+    Si el modelo no devolvió JSON bien formado, usa el texto completo como
+    cuerpo y `fallback_subject` (por defecto "High Risk SOW: <sow_id>").
+    """
+    if fallback_subject is None:
+        fallback_subject = f"High Risk SOW: {sow_id}"
+
+    try:
+        email_data = orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return fallback_subject, content
+
+    subject = email_data.get("subject", fallback_subject)
+    body = email_data.get("body", content)
+    return subject, body
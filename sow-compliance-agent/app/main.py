@@ -1,19 +1,23 @@
 import os
-import json
 import yaml
 import smtplib
+import asyncio
 from email.message import EmailMessage
 from datetime import date
 from pathlib import Path
 
 
+import aiosmtplib
 from sqlalchemy.orm import Session
 from langchain_ollama import ChatOllama
-from langchain_core.prompts import PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
 
 # Asegúrate de que estos imports funcionen con tus archivos locales
 from .database import init_db, get_db
 from .crud import create_or_update_sow
+from .email_utils import sow_to_prompt_json, response_content, parse_email_response
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -32,23 +36,39 @@ email_setup = config.get('email', {}) # Usar un dict vacío como default
 # Se cambió el modelo a 'mistral:7b'
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral:7b")
+# Cuánto tiempo mantiene Ollama el modelo cargado en memoria tras cada llamada
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Ventana de contexto: system prompt (~200 tokens) + JSON del SOW (~250)
+# + respuesta caben holgados en 2048. Cambiarla hace que Ollama recargue el modelo.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 2048))
 ALERT_EMAIL_FROM = os.getenv("ALERT_EMAIL_FROM", email_setup.get('ALERT_EMAIL_FROM'))
 ALERT_EMAIL_TO = os.getenv("ALERT_EMAIL_TO", email_setup.get('ALERT_EMAIL_TO'))
 SMTP_HOST = os.getenv("SMTP_HOST", email_setup.get('SMTP_HOST'))
 SMTP_PORT = int(os.getenv("SMTP_PORT", email_setup.get('SMTP_PORT', 587)))
 SMTP_USER = os.getenv("SMTP_USER", ALERT_EMAIL_FROM)
 SMTP_PASS = os.getenv("SMTP_PASS", email_setup.get('SMTP_PASS'))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.db")
+# Máximo de prompts que se mandan a Ollama a la vez en un batch de alertas
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
 
 
 # ---------- LangChain / Ollama setup ----------
+# Caché persistente de respuestas del LLM: un SOW con el mismo payload
+# no vuelve a pasar por mistral (la operación más cara del pipeline).
+set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+
 llm = ChatOllama(
     model=OLLAMA_MODEL,
     base_url=OLLAMA_BASE_URL,
     temperature=0.3,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    num_ctx=OLLAMA_NUM_CTX,
 )
 
-email_prompt = PromptTemplate.from_template(
-    """
+# Parte estática del prompt en el mensaje system: es idéntica en cada
+# llamada, así que Ollama reutiliza su KV-cache de prefijo y solo procesa
+# el JSON del SOW (mensaje user).
+EMAIL_SYSTEM_PROMPT = """
 You are an assistant that writes clear, concise email alerts.
 
 Write an email to notify the SOW owner that a new SOW has been registered
@@ -67,22 +87,45 @@ Return your response in this JSON format:
   "subject": "<subject line>",
   "body": "<email body text>"
 }}
+"""
 
-SOW data (JSON):
+EMAIL_USER_PROMPT = """SOW data (JSON):
 {sow_json}
 """
+
+email_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", EMAIL_SYSTEM_PROMPT),
+        ("user", EMAIL_USER_PROMPT),
+    ]
 )
 
-email_chain = email_prompt | llm
+email_chain = (email_prompt | llm).with_config(run_name="email", tags=["email"])
 
 
-# ---------- Email sending helper ----------
-def send_email(subject: str, body: str, to_email: str):
+async def warmup_llm():
+    """
+    Manda un prompt mínimo a Ollama para que cargue los pesos del modelo
+    antes de la primera alerta real. Usa una copia de `llm` sin caché (si no,
+    a partir del segundo arranque respondería la caché y Ollama no cargaría nada)
+    y limitada a 1 token.
+    """
+    warmup = llm.model_copy(update={"cache": False, "num_predict": 1})
+    await warmup.ainvoke("ping")
+
+
+# ---------- Email sending helpers ----------
+def _build_message(subject: str, body: str, to_email: str) -> EmailMessage:
     msg = EmailMessage()
     msg["From"] = ALERT_EMAIL_FROM
     msg["To"] = to_email
     msg["Subject"] = subject
     msg.set_content(body)
+    return msg
+
+
+def send_email(subject: str, body: str, to_email: str):
+    msg = _build_message(subject, body, to_email)
 
     with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
         server.starttls()
@@ -91,6 +134,45 @@ def send_email(subject: str, body: str, to_email: str):
         server.send_message(msg)
 
 
+# Conexión SMTP persistente para el API: STARTTLS + login se hacen una sola
+# vez y no por cada correo. SMTP es secuencial, así que el lock serializa
+# los envíos sobre la misma conexión.
+_smtp_client = aiosmtplib.SMTP(
+    hostname=SMTP_HOST,
+    port=SMTP_PORT,
+    username=SMTP_USER,
+    password=SMTP_PASS,
+    start_tls=True,
+)
+_smtp_lock = asyncio.Lock()
+
+
+async def send_email_async(subject: str, body: str, to_email: str):
+    """Versión async de send_email que reutiliza la conexión SMTP persistente."""
+    msg = _build_message(subject, body, to_email)
+
+    async with _smtp_lock:
+        if not _smtp_client.is_connected:
+            await _smtp_client.connect()
+
+        try:
+            await _smtp_client.send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            # El servidor cerró la conexión (p. ej. por inactividad): reconectar y reintentar
+            _smtp_client.close()
+            await _smtp_client.connect()
+            await _smtp_client.send_message(msg)
+
+
+async def close_smtp_client():
+    """Cierra la conexión SMTP persistente (se llama al apagar el API)."""
+    if _smtp_client.is_connected:
+        try:
+            await _smtp_client.quit()
+        except aiosmtplib.SMTPException:
+            _smtp_client.close()
+
+
 # ---------- High-risk check helper ----------
 def is_high_risk_or_status(risk: str | None, status: str | None) -> bool:
     """Checks if a record should trigger an alert."""
@@ -100,23 +182,24 @@ def is_high_risk_or_status(risk: str | None, status: str | None) -> bool:
     return risk_val == "high" or status_val == "flagged"
 
 
-# ----------------------------------------------------------------------
-# ---------- Core logic for a single SOW dict (MODIFIED LOGIC) ----------
-# ----------------------------------------------------------------------
-def process_sow_record(db: Session, raw_sow_dict: dict):
+# ---------- LLM prompt / response helpers ----------
+def build_email_prompt_input(sow_obj) -> dict:
+    """Construye el input de `email_chain` a partir de un SOW persistido."""
+    return {"sow_json": sow_to_prompt_json(sow_obj)}
+
+
+def apply_default_status(raw_sow_dict: dict) -> dict:
     """
-    Processes a single SOW record.
-    1. Assigns default status ('flagged' or 'healthy') if status is missing.
-    2. Inserts/updates the record.
-    3. Sends an email if newly created and high risk/flagged.
+    Devuelve una copia del SOW con 'status' asignado si no viene en la entrada:
+    'flagged' si el riesgo es 'high', 'healthy' en cualquier otro caso.
     """
-    # 1. Crear una copia mutable del diccionario de entrada
+    # Crear una copia mutable del diccionario de entrada
     sow_data = raw_sow_dict.copy()
 
     # Obtener el valor de 'risk' de manera segura
     risk_val = (sow_data.get('risk') or "").strip().lower()
     
-    # 2. Lógica para asignar 'status' si no está presente en la entrada
+    # Lógica para asignar 'status' si no está presente en la entrada
     if 'status' not in sow_data:
         # Tu punto 1: si risk es 'high', asignar 'flagged' (y esto disparará el email)
         if risk_val == "high":
@@ -124,60 +207,83 @@ def process_sow_record(db: Session, raw_sow_dict: dict):
         # Tu punto 2: si no hay riesgo (o es bajo/medio), asignar 'healthy'
         else:
             sow_data['status'] = "healthy"
+
+    return sow_data
+
+
+# ---------- Batched alert emails ----------
+def alert_for(sow_obj, action: str) -> tuple[str, dict] | None:
+    """
+    Si el SOW es recién creado Y de alto riesgo/flagged devuelve
+    (sow_id, input del prompt) con los datos actuales; si no, None.
+    """
+    if action == "created" and is_high_risk_or_status(sow_obj.risk, sow_obj.status):
+        return sow_obj.sow_id, build_email_prompt_input(sow_obj)
+    return None
+
+
+def send_alert_emails(alerts: list[tuple[str, dict]]):
+    """
+    Genera todos los correos en un solo `email_chain.batch` (Ollama procesa
+    los prompts concurrentemente) y luego los envía.
+    """
+    if not alerts:
+        return
+
+    llm_responses = email_chain.batch(
+        [prompt_input for _, prompt_input in alerts],
+        config={"max_concurrency": LLM_MAX_CONCURRENCY},
+    )
+
+    for (sow_id, _), llm_response in zip(alerts, llm_responses):
+        subject, body = parse_email_response(response_content(llm_response), sow_id)
+        send_email(subject, body, ALERT_EMAIL_TO)
+        print(f"Email sent for HIGH RISK SOW {sow_id}")
+
+
+async def asend_alert_emails(alerts: list[tuple[str, dict]]):
+    """
+    Versión async de send_alert_emails: los correos se generan con un solo
+    `abatch` y se envían uno tras otro por la conexión SMTP persistente
+    (SMTP es secuencial). Un envío fallido se reporta y no corta el resto.
+    """
+    if not alerts:
+        return
+
+    llm_responses = await email_chain.abatch(
+        [prompt_input for _, prompt_input in alerts],
+        config={"max_concurrency": LLM_MAX_CONCURRENCY},
+    )
+
+    for (sow_id, _), llm_response in zip(alerts, llm_responses):
+        subject, body = parse_email_response(response_content(llm_response), sow_id)
+        try:
+            await send_email_async(subject, body, ALERT_EMAIL_TO)
+        except (aiosmtplib.SMTPException, OSError) as exc:
+            print(f"Email FAILED for HIGH RISK SOW {sow_id}: {exc}")
+            continue
+        print(f"Email sent for HIGH RISK SOW {sow_id}")
+
+
+# ----------------------------------------------------------------------
+# ---------- Core logic for a single SOW dict (MODIFIED LOGIC) ----------
+# ----------------------------------------------------------------------
+def process_sow_record(db: Session, raw_sow_dict: dict):
+    """
+    Processes a single SOW record (DB only).
+    1. Assigns default status ('flagged' or 'healthy') if status is missing.
+    2. Inserts/updates the record.
+    Alert emails are generated afterwards in batch: see alert_for and
+    send_alert_emails.
+    """
+    # 1-2. Asignar status por defecto si no viene en la entrada
+    sow_data = apply_default_status(raw_sow_dict)
     
     # 3. Insertar/Actualizar el SOW en la base de datos
     sow_obj, action = create_or_update_sow(db, sow_data)
 
-    # 4. Lógica de email: Solo cuando es recién creado Y es de alto riesgo/flagged
     if action == "created":
-        if is_high_risk_or_status(sow_obj.risk, sow_obj.status):
-            
-            # Prepare JSON for the model
-            sow_json = json.dumps(
-                {
-                    "sow_id": sow_obj.sow_id,
-                    "sow_title": sow_obj.sow_title,
-                    "sow_status": sow_obj.sow_status,
-                    "risk": sow_obj.risk,
-                    "status": sow_obj.status, # Esto ahora será 'flagged' o 'healthy'
-                    "supplier": sow_obj.supplier,
-                    "business_unit": sow_obj.business_unit,
-                    "primary_lob": sow_obj.primary_lob,
-                    "sow_owner": sow_obj.sow_owner,
-                    "start_date": sow_obj.start_date.isoformat() if sow_obj.start_date else None,
-                    "end_date": sow_obj.end_date.isoformat() if sow_obj.end_date else None,
-                    "latest_maximum_budget": sow_obj.latest_maximum_budget,
-                    "currency": sow_obj.currency,
-                },
-                default=str,
-            )
-
-            # Call Ollama via LangChain
-            llm_response = email_chain.invoke({"sow_json": sow_json})
-
-            # llm_response is a ChatMessage-like object; take its content
-            try:
-                content = llm_response.content
-            except AttributeError:
-                content = str(llm_response)
-
-            # Parse JSON from the model output (be a bit defensive)
-            try:
-                # Intenta encontrar y cargar el bloque JSON
-                email_data = json.loads(content) 
-                subject = email_data.get("subject", f"High Risk SOW: {sow_obj.sow_id}")
-                body = email_data.get("body", content)
-            except json.JSONDecodeError:
-                # If model didn't return perfect JSON, fallback
-                subject = f"High Risk SOW: {sow_obj.sow_id}"
-                body = content
-
-            # Send the email
-            send_email(subject, body, ALERT_EMAIL_TO)
-
-            print(f"Email sent for HIGH RISK SOW {sow_obj.sow_id}")
-        else:
-            print(f"New SOW created (not high risk): {sow_obj.sow_id}")
+        print(f"New SOW created: {sow_obj.sow_id}")
     else:
         print(f"SOW updated: {sow_obj.sow_id}")
 
@@ -249,12 +355,22 @@ def main():
     db_gen = get_db()
     db = next(db_gen)
     try:
+        alerts = []
         for raw_sow in dataset:
             sow_obj, action = process_sow_record(db, raw_sow)
             print(
                 f"{action=}, id={sow_obj.id}, sow_id={sow_obj.sow_id}, "
                 f"risk={sow_obj.risk}, status={sow_obj.status}"
             )
+            alert = alert_for(sow_obj, action)
+            if alert is not None:
+                alerts.append(alert)
+
+        # One commit for the whole dataset
+        db.commit()
+
+        # 3) Generate + send all alert emails in one LLM batch
+        send_alert_emails(alerts)
     finally:
         try:
             next(db_gen)
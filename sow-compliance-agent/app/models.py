@@ -1,11 +1,17 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, Float
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, Float, Index
 
 class SOW(Base):
     __tablename__ = "sow"
+    __table_args__ = (
+        # Filtros/agrupaciones del dashboard por risk + status
+        Index("ix_sow_risk_status", "risk", "status"),
+        # Búsquedas por sow_id (upsert de /upload y /generate-email/{sow_id})
+        Index("ix_sow_sow_id", "sow_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    sow_id = Column(String, unique=True)                       # "SOW ID"
+    sow_id = Column(String)                                                    # "SOW ID"
     days_before_expiration = Column(Integer, nullable=False)                   # "# Days before expiration"
     sow_status = Column(String, nullable=False)                                # "SOW Status"
     sow_title = Column(String, nullable=False)                                 # "SOW title"
@@ -19,5 +25,5 @@ class SOW(Base):
     business_unit = Column(String, nullable=False)                             # "Business Unit"
     primary_lob = Column(String, nullable=False)                               # "Primary LOB"
     sow_owner = Column(String, nullable=False)                                 # "SOW owner"
-    risk = Column(String, nullable=False, index=True)                                      # "risk"
-    status = Column(String, nullable=False, index=True)                                    # "status"
\ No newline at end of file
+    risk = Column(String, nullable=False)                                      # "risk"
+    status = Column(String, nullable=False)                                    # "status"
\ No newline at end of file
@@ -0,0 +1,29 @@
+# responses.py
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _orjson_default(obj: Any) -> Any:
+    """
+    Fallback para tipos que orjson no serializa de forma nativa, como las
+    subclases de date/datetime (p. ej. pandas.Timestamp).
+    """
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse serializada con orjson (mucho más rápido que el json estándar
+    en payloads grandes como /analyze).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
@@ -1,9 +1,12 @@
 # schemas.py
 from datetime import date
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, ConfigDict
 
 
 class CreateSOWRequest(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     sow_id: str
     days_before_expiration: int
     sow_status: str
@@ -20,3 +23,40 @@ class CreateSOWRequest(BaseModel):
     sow_owner: str
     risk: str
     status: str
+
+
+# ---------- Response schemas ----------
+class UploadResponse(BaseModel):
+    message: str
+    total_received: int
+    created: int
+    updated: int
+    sow_ids: List[str]
+
+
+class SOWItem(BaseModel):
+    sow_id: str
+    contract_id: str
+    title: str
+    status: str
+    risk: str
+    days_before_expiration: int
+    active_workers: int
+    latest_maximum_budget: float
+    currency: str
+    supplier: str
+    business_unit: str
+    primary_lob: str
+    sow_owner: str
+
+
+class AnalyzeResponse(BaseModel):
+    total: int
+    items: List[SOWItem]
+
+
+class GenerateEmailResponse(BaseModel):
+    message: str
+    sow_id: str
+    subject: str
+    to: str
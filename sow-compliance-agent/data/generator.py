@@ -1,12 +1,10 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
 
 # NO fijar seed para tener variedad en cada ejecución
-# Si quieres resultados reproducibles, descomenta las siguientes líneas:
-# np.random.seed(42)
-# random.seed(42)
+# Si quieres resultados reproducibles, pasa rng=np.random.default_rng(42)
+# a generate_synthetic_sows
 
 # Listas para generar datos realistas
 SUPPLIERS = [
@@ -58,6 +56,52 @@ SOW_STATUS = ["Active", "Active", "Active", "Active", "Pending Renewal"]
 
 CURRENCIES = ["USD", "USD", "USD", "EUR", "GBP"]
 
+# Las mismas listas como arrays de NumPy (se construyen una sola vez): el
+# muestreo de n valores es un draw de índices + fancy indexing en C
+_SUPPLIERS = np.asarray(SUPPLIERS, dtype=object)
+_BUSINESS_UNITS = np.asarray(BUSINESS_UNITS, dtype=object)
+_PRIMARY_LOB = np.asarray(PRIMARY_LOB, dtype=object)
+_SOW_TITLES = np.asarray(SOW_TITLES, dtype=object)
+_SOW_OWNERS = np.asarray(SOW_OWNERS, dtype=object)
+_CURRENCIES = np.asarray(CURRENCIES, dtype=object)
+_NEAR_EXPIRY_STATUS = np.asarray(["Active", "Pending Renewal", "Active"], dtype=object)
+_YEARS = np.array([2023, 2024, 2025])
+_CONTRACT_DURATIONS = np.array([180, 270, 365, 545, 730])
+
+# Casos críticos garantizados para la demo, en formato columnar (un array
+# tipado por columna). Las fechas se calculan en el main relativas a hoy
+# con CRITICAL_START_OFFSETS y "# Days before expiration".
+CRITICAL_CASES_SOA = {
+    "SOW ID": np.array(["SOW-2024-CRIT-001", "SOW-2024-CRIT-002", "SOW-2024-CRIT-003", "SOW-2024-CRIT-004"]),
+    "# Days before expiration": np.array([28, 15, -5, 20], dtype=np.int32),
+    "SOW Status": np.array(["Active", "Active", "Expired", "Active"]),
+    "SOW title": np.array([
+        "Enterprise Data Platform Development",
+        "Cloud Infrastructure Migration",
+        "Cybersecurity Operations Support",
+        "Software License Management",
+    ]),
+    "Contract Id": np.array(["CNT-2024-CRIT-001", "CNT-2024-CRIT-002", "CNT-2024-CRIT-003", "CNT-2024-CRIT-004"]),
+    "Active SOW workers": np.array([25, 12, 8, 0], dtype=np.int32),
+    "Latest maximum budget": np.array([1500000, 850000, 450000, 75000], dtype=np.int64),
+    "currency": np.array(["USD", "USD", "USD", "USD"]),
+    "supplier": np.array(["Accenture", "Deloitte", "Cognizant", "Tech Solutions Inc"]),
+    "Business Unit": np.array(["Technology", "Technology", "Technology", "Finance"]),
+    "Primary LOB": np.array(["Data Engineering", "Cloud Services", "Cybersecurity", "IT Infrastructure"]),
+    "SOW owner": np.array(["Sarah Chen", "Michael Rodriguez", "Jennifer Lee", "David Kim"]),
+}
+
+# Días (negativos) desde hoy hasta el Start Date de cada caso crítico
+CRITICAL_START_OFFSETS = np.array([-337, -350, -370, -345], dtype='timedelta64[D]')
+
+# Orden de columnas del CSV
+CSV_COLUMNS = [
+    "SOW ID", "# Days before expiration", "SOW Status", "SOW title",
+    "Contract Id", "Active SOW workers", "Start Date", "End date",
+    "Latest maximum budget", "currency", "supplier", "Business Unit",
+    "Primary LOB", "SOW owner"
+]
+
 
 def generate_sow_id(year, index):
     """Genera un SOW ID realista"""
@@ -69,111 +113,127 @@ def generate_contract_id(year, index):
     return f"CNT-{year}-{str(index).zfill(4)}"
 
 
-def generate_realistic_workers(days_to_expire, budget):
+def _sample(values, n, rng):
+    """Devuelve n elementos de `values` elegidos uniformemente (con reemplazo)"""
+    return values[rng.integers(0, values.size, n)]
+
+
+def workers_from_vectors(days_to_expire, budget, rng):
     """
-    Genera número de workers basado en lógica de negocio:
+    Genera número de workers (vectorizado) basado en lógica de negocio:
     - Contratos grandes (>500k) tienden a tener más workers
     - Contratos ya expirados tienen MUY BAJA probabilidad de tener workers
     - Contratos activos normales tienen más workers
+
+    Recibe arrays de días para expirar y budget; devuelve un array int64.
     """
+    n = len(days_to_expire)
+    
+    m_expired = days_to_expire < 0
+    m_big = budget > 500000
+    m_med = budget > 200000
+    m_small = budget > 50000
+    
     # Si ya expiró, casi nunca tiene workers (solo 5% probabilidad)
-    if days_to_expire < 0:
-        return 0 if random.random() > 0.05 else random.randint(1, 2)
-    
-    # Contratos activos - asignar workers según budget
-    if budget > 500000:
-        return random.randint(10, 50)
-    elif budget > 200000:
-        return random.randint(5, 20)
-    elif budget > 50000:
-        return random.randint(1, 10)
-    else:
-        return random.randint(0, 5)
+    expired_draw = np.where(rng.random(n) < 0.05, rng.integers(1, 3, n), 0)
+    
+    # Contratos activos - asignar workers según budget (np.select respeta el orden)
+    return np.select(
+        [m_expired, m_big, m_med, m_small],
+        [
+            expired_draw,
+            rng.integers(10, 51, n),
+            rng.integers(5, 21, n),
+            rng.integers(1, 11, n),
+        ],
+        default=rng.integers(0, 6, n),
+    ).astype(np.int64)
 
 
-def generate_synthetic_sows(n_sows=150, add_criticals=True):
+def generate_synthetic_sows(n_sows=150, add_criticals=True, rng=None):
     """
     Genera dataset sintético de SOWs simulando data real de Fieldglass
     Si add_criticals=True, ajusta la distribución para tener más casos críticos
+
+    Todas las columnas se generan de forma vectorizada (un draw de NumPy por
+    columna, no por fila). `rng` permite pasar un np.random.Generator con
+    seed para resultados reproducibles.
     """
-    data = []
+    if rng is None:
+        rng = np.random.default_rng()
     
-    today = datetime.now()
+    today = np.datetime64(datetime.now().date(), 'D')
     
     # Si queremos casos críticos, ajustamos n_sows
     if add_criticals:
         n_sows = n_sows - 4  # Restar los 4 casos críticos que añadiremos después
     
-    for i in range(n_sows):
-        year = random.choice([2023, 2024, 2025])
-        sow_id = generate_sow_id(year, i + 1)
-        contract_id = generate_contract_id(year, i + 1)
-        
-        # Generar fechas de inicio y fin de forma más controlada
-        # Queremos que la mayoría de contratos estén en un rango útil para el análisis
-        contract_duration_days = random.choice([180, 270, 365, 545, 730])
-        
-        # Distribuir los contratos de forma más inteligente:
-        # 80% expiran en el futuro (31 a +365 días desde hoy)
-        # 15% expiran pronto (1 a 30 días)
-        # 5% expiraron recientemente (-10 a 0 días) - MUY POCOS
-        distribution = random.random()
-        
-        if distribution < 0.80:  # 80% - Contratos normales en el futuro
-            days_to_expiration = random.randint(31, 365)
-        elif distribution < 0.95:  # 15% - Contratos próximos a expirar
-            days_to_expiration = random.randint(1, 30)
-        else:  # 5% - Contratos recién expirados (SOLO unos pocos)
-            days_to_expiration = random.randint(-10, 0)
-        
-        # Calcular end_date basado en days_to_expiration
-        end_date = today + timedelta(days=days_to_expiration)
-        start_date = end_date - timedelta(days=contract_duration_days)
-        
-        # Calcular días para expiración
-        days_before_expiration = days_to_expiration  # Ya lo calculamos arriba
-        
-        # Generar budget realista
-        budget = random.choice([
-            random.randint(25000, 100000),
-            random.randint(100000, 300000),
-            random.randint(300000, 750000),
-            random.randint(750000, 2000000)
-        ])
-        
-        # Generar workers
-        active_workers = generate_realistic_workers(days_before_expiration, budget)
-        
-        # Status basado en días de expiración
-        if days_before_expiration < 0:
-            status = "Expired"
-        elif days_before_expiration < 30:
-            status = random.choice(["Active", "Pending Renewal", "Active"])
-        else:
-            status = "Active"
-        
-        # Construir registro
-        sow = {
-            "SOW ID": sow_id,
-            "# Days before expiration": days_before_expiration,
-            "SOW Status": status,
-            "SOW title": random.choice(SOW_TITLES),
-            "Contract Id": contract_id,
-            "Active SOW workers": active_workers,
-            "Start Date": start_date.strftime("%Y-%m-%d"),
-            "End date": end_date.strftime("%Y-%m-%d"),
-            "Latest maximum budget": budget,
-            "currency": random.choice(CURRENCIES),
-            "supplier": random.choice(SUPPLIERS),
-            "Business Unit": random.choice(BUSINESS_UNITS),
-            "Primary LOB": random.choice(PRIMARY_LOB),
-            "SOW owner": random.choice(SOW_OWNERS)
-        }
-        
-        data.append(sow)
-    
-    # Crear DataFrame
-    df = pd.DataFrame(data)
+    years = _sample(_YEARS, n_sows, rng)
+    seq = pd.Series(np.arange(1, n_sows + 1)).astype(str).str.zfill(4)
+    year_str = pd.Series(years).astype(str)
+    sow_ids = "SOW-" + year_str + "-" + seq
+    contract_ids = "CNT-" + year_str + "-" + seq
+    
+    # Generar fechas de inicio y fin de forma más controlada
+    # Queremos que la mayoría de contratos estén en un rango útil para el análisis
+    contract_duration_days = _sample(_CONTRACT_DURATIONS, n_sows, rng)
+    
+    # Distribuir los contratos de forma más inteligente:
+    # 80% expiran en el futuro (31 a +365 días desde hoy)
+    # 15% expiran pronto (1 a 30 días)
+    # 5% expiraron recientemente (-10 a 0 días) - MUY POCOS
+    distribution = rng.random(n_sows)
+    days_before_expiration = np.where(
+        distribution < 0.80,
+        rng.integers(31, 366, n_sows),          # 80% - Contratos normales en el futuro
+        np.where(
+            distribution < 0.95,
+            rng.integers(1, 31, n_sows),        # 15% - Contratos próximos a expirar
+            rng.integers(-10, 1, n_sows),       # 5% - Contratos recién expirados
+        ),
+    )
+    
+    # Calcular end_date / start_date basado en days_before_expiration
+    end_dates = today + days_before_expiration.astype('timedelta64[D]')
+    start_dates = end_dates - contract_duration_days.astype('timedelta64[D]')
+    
+    # Generar budget realista: uno de 4 rangos, uniforme dentro del rango
+    budget_low = np.array([25000, 100000, 300000, 750000])
+    budget_high = np.array([100000, 300000, 750000, 2000000])
+    budget_bucket = rng.integers(0, 4, n_sows)
+    budgets = rng.integers(budget_low[budget_bucket], budget_high[budget_bucket] + 1)
+    
+    # Generar workers
+    active_workers = workers_from_vectors(days_before_expiration, budgets, rng)
+    
+    # Status basado en días de expiración
+    status = np.where(
+        days_before_expiration < 0,
+        "Expired",
+        np.where(
+            days_before_expiration < 30,
+            _sample(_NEAR_EXPIRY_STATUS, n_sows, rng),
+            "Active",
+        ),
+    )
+    
+    # Crear DataFrame columna por columna
+    df = pd.DataFrame({
+        "SOW ID": sow_ids,
+        "# Days before expiration": days_before_expiration,
+        "SOW Status": status,
+        "SOW title": _sample(_SOW_TITLES, n_sows, rng),
+        "Contract Id": contract_ids,
+        "Active SOW workers": active_workers,
+        "Start Date": start_dates.astype('datetime64[ns]'),
+        "End date": end_dates.astype('datetime64[ns]'),
+        "Latest maximum budget": budgets,
+        "currency": _sample(_CURRENCIES, n_sows, rng),
+        "supplier": _sample(_SUPPLIERS, n_sows, rng),
+        "Business Unit": _sample(_BUSINESS_UNITS, n_sows, rng),
+        "Primary LOB": _sample(_PRIMARY_LOB, n_sows, rng),
+        "SOW owner": _sample(_SOW_OWNERS, n_sows, rng),
+    })
     
     # Ordenar por días antes de expiración (los más críticos primero)
     df = df.sort_values("# Days before expiration")
@@ -190,16 +250,31 @@ def add_critical_cases(df):
 
 
 def generate_statistics(df):
-    """Genera estadísticas del dataset para validación"""
+    """
+    Genera estadísticas del dataset para validación
+
+    Las columnas se leen una sola vez como arrays y todas las métricas
+    se reducen sobre las mismas máscaras booleanas.
+    """
+    days = df["# Days before expiration"].to_numpy()
+    workers = df["Active SOW workers"].to_numpy()
+    budget = df["Latest maximum budget"].to_numpy()
+    currency = df["currency"].to_numpy()
+    
+    mask_crit = days <= 30
+    mask_wrk = workers > 0
+    mask_exp = days < 0
+    mask_usd = currency == "USD"
+    
     stats = {
         "Total SOWs": len(df),
-        "SOWs Críticos (≤30 días)": len(df[df["# Days before expiration"] <= 30]),
-        "SOWs con Workers": len(df[df["Active SOW workers"] > 0]),
-        "SOWs Críticos con Workers": len(df[(df["# Days before expiration"] <= 30) & (df["Active SOW workers"] > 0)]),
-        "Total Workers en Riesgo (≤30 días)": df[df["# Days before expiration"] <= 30]["Active SOW workers"].sum(),
-        "Budget Total (USD)": df[df["currency"] == "USD"]["Latest maximum budget"].sum(),
-        "Promedio Workers por SOW": df["Active SOW workers"].mean(),
-        "SOWs Expirados": len(df[df["# Days before expiration"] < 0])
+        "SOWs Críticos (≤30 días)": int(np.count_nonzero(mask_crit)),
+        "SOWs con Workers": int(np.count_nonzero(mask_wrk)),
+        "SOWs Críticos con Workers": int(np.count_nonzero(mask_crit & mask_wrk)),
+        "Total Workers en Riesgo (≤30 días)": int(workers[mask_crit].sum()),
+        "Budget Total (USD)": int(budget[mask_usd].sum()),
+        "Promedio Workers por SOW": float(workers.mean()),
+        "SOWs Expirados": int(np.count_nonzero(mask_exp))
     }
     
     return stats
@@ -212,88 +287,21 @@ if __name__ == "__main__":
     
     # PRIMERO: Crear los 4 casos críticos
     print("\n Creando 4 casos críticos garantizados para la demo...\n")
-    today = datetime.now()
-    critical_cases = []
-    
-    # Caso 1: SOW MUY CRÍTICO con muchos workers (28 días)
-    critical_cases.append({
-        "SOW ID": "SOW-2024-CRIT-001",
-        "# Days before expiration": 28,
-        "SOW Status": "Active",
-        "SOW title": "Enterprise Data Platform Development",
-        "Contract Id": "CNT-2024-CRIT-001",
-        "Active SOW workers": 25,
-        "Start Date": (today - timedelta(days=337)).strftime("%Y-%m-%d"),
-        "End date": (today + timedelta(days=28)).strftime("%Y-%m-%d"),
-        "Latest maximum budget": 1500000,
-        "currency": "USD",
-        "supplier": "Accenture",
-        "Business Unit": "Technology",
-        "Primary LOB": "Data Engineering",
-        "SOW owner": "Sarah Chen"
-    })
-    print("   ✓ Caso 1: 28 días, 25 workers - CRÍTICO")
+    today = np.datetime64(datetime.now().date(), 'D')
+    days_crit = CRITICAL_CASES_SOA["# Days before expiration"]
     
-    # Caso 2: SOW CRÍTICO con workers moderados (15 días)
-    critical_cases.append({
-        "SOW ID": "SOW-2024-CRIT-002",
-        "# Days before expiration": 15,
-        "SOW Status": "Active",
-        "SOW title": "Cloud Infrastructure Migration",
-        "Contract Id": "CNT-2024-CRIT-002",
-        "Active SOW workers": 12,
-        "Start Date": (today - timedelta(days=350)).strftime("%Y-%m-%d"),
-        "End date": (today + timedelta(days=15)).strftime("%Y-%m-%d"),
-        "Latest maximum budget": 850000,
-        "currency": "USD",
-        "supplier": "Deloitte",
-        "Business Unit": "Technology",
-        "Primary LOB": "Cloud Services",
-        "SOW owner": "Michael Rodriguez"
-    })
-    print("   ✓ Caso 2: 15 días, 12 workers - CRÍTICO")
+    critical_data = dict(CRITICAL_CASES_SOA)
+    critical_data["Start Date"] = (today + CRITICAL_START_OFFSETS).astype('datetime64[ns]')
+    critical_data["End date"] = (today + days_crit.astype('timedelta64[D]')).astype('datetime64[ns]')
     
-    # Caso 3: SOW YA EXPIRADO con workers (¡COMPLIANCE ISSUE!)
-    critical_cases.append({
-        "SOW ID": "SOW-2024-CRIT-003",
-        "# Days before expiration": -5,
-        "SOW Status": "Expired",
-        "SOW title": "Cybersecurity Operations Support",
-        "Contract Id": "CNT-2024-CRIT-003",
-        "Active SOW workers": 8,
-        "Start Date": (today - timedelta(days=370)).strftime("%Y-%m-%d"),
-        "End date": (today - timedelta(days=5)).strftime("%Y-%m-%d"),
-        "Latest maximum budget": 450000,
-        "currency": "USD",
-        "supplier": "Cognizant",
-        "Business Unit": "Technology",
-        "Primary LOB": "Cybersecurity",
-        "SOW owner": "Jennifer Lee"
-    })
-    print("   ✓ Caso 3: -5 días (EXPIRADO), 8 workers - COMPLIANCE ISSUE!")
+    # Crear DataFrame de casos críticos directamente desde los arrays
+    df_critical = pd.DataFrame(critical_data, columns=CSV_COLUMNS)
     
-    # Caso 4: SOW crítico SIN workers (menos prioritario pero importante)
-    critical_cases.append({
-        "SOW ID": "SOW-2024-CRIT-004",
-        "# Days before expiration": 20,
-        "SOW Status": "Active",
-        "SOW title": "Software License Management",
-        "Contract Id": "CNT-2024-CRIT-004",
-        "Active SOW workers": 0,
-        "Start Date": (today - timedelta(days=345)).strftime("%Y-%m-%d"),
-        "End date": (today + timedelta(days=20)).strftime("%Y-%m-%d"),
-        "Latest maximum budget": 75000,
-        "currency": "USD",
-        "supplier": "Tech Solutions Inc",
-        "Business Unit": "Finance",
-        "Primary LOB": "IT Infrastructure",
-        "SOW owner": "David Kim"
-    })
+    print("   ✓ Caso 1: 28 días, 25 workers - CRÍTICO")
+    print("   ✓ Caso 2: 15 días, 12 workers - CRÍTICO")
+    print("   ✓ Caso 3: -5 días (EXPIRADO), 8 workers - COMPLIANCE ISSUE!")
     print("   ✓ Caso 4: 20 días, 0 workers - MEDIO")
     
-    # Crear DataFrame de casos críticos
-    df_critical = pd.DataFrame(critical_cases)
-    
     # SEGUNDO: Generar el resto de SOWs (146 para llegar a 150 total)
     print("\n Generando 146 SOWs adicionales...")
     df_regular = generate_synthetic_sows(n_sows=146, add_criticals=False)
@@ -301,17 +309,29 @@ if __name__ == "__main__":
     # TERCERO: Combinar (críticos primero)
     df = pd.concat([df_critical, df_regular], ignore_index=True)
     
-    # CUARTO: Ordenar por criticidad
-    df = df.sort_values(
-        by=["# Days before expiration", "Active SOW workers"],
-        ascending=[True, False]
-    ).reset_index(drop=True)
+    # CUARTO: Ordenar por criticidad (días ascendente, workers descendente).
+    # np.lexsort ordena por la última clave primero y es estable
+    order = np.lexsort((
+        -df["Active SOW workers"].to_numpy(),
+        df["# Days before expiration"].to_numpy(),
+    ))
+    df = df.take(order).reset_index(drop=True)
+    
+    # Fijar dtypes antes de guardar: Parquet los conserva y read_parquet no
+    # tiene que re-inferirlos (las fechas ya son datetime64[ns])
+    df = df.astype({
+        "# Days before expiration": np.int32,
+        "Active SOW workers": np.int16,
+        "Latest maximum budget": np.int64,
+    })
     
-    # Guardar CSV
-    output_file = "synthetic_sows_fieldglass.csv"
-    df.to_csv(output_file, index=False)
+    # Guardar Parquet (lo que lee el entrenamiento) y CSV (inspección / compatibilidad).
+    # to_csv escribe las fechas datetime64 como YYYY-MM-DD
+    output_file = "synthetic_sows_fieldglass.parquet"
+    df.to_parquet(output_file, engine="pyarrow", compression="zstd", index=False)
+    df.to_csv("synthetic_sows_fieldglass.csv", index=False)
     
-    print(f" Dataset generado: {output_file}")
+    print(f" Dataset generado: {output_file} (+ CSV)")
     print(f" Total de registros: {len(df)}")
     print("-" * 60)
     
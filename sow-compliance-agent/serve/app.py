@@ -1,13 +1,47 @@
 # serve/app.py
-from typing import List
-import json
+from typing import Iterator, List
 
+import orjson
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.database import init_db, get_db
+from app.crud import bulk_upsert_sows
+from app.database import SessionLocal, init_db, get_db
+from app.email_utils import parse_email_response, response_content
 from app.models import SOW
-from app.main import process_sow_record, email_chain, send_email, ALERT_EMAIL_TO
+from app.main import (
+    apply_default_status,
+    alert_for,
+    build_email_prompt_input,
+    send_alert_emails,
+    email_chain,
+    send_email,
+    ALERT_EMAIL_TO,
+)
+
+# Referencias locales para el camino caliente de /generate-email
+# (evita re-resolver atributos de módulo en cada request)
+_EMAIL_CHAIN = email_chain
+_SEND = send_email
+_TO = ALERT_EMAIL_TO
+_PROMPT_INPUT = build_email_prompt_input
+_PARSE_EMAIL = parse_email_response
+
+# Columnas que devuelve /analyze (proyección en SQL, sin hidratar objetos ORM)
+ANALYZE_COLUMNS = (
+    SOW.sow_id,
+    SOW.contract_id,
+    SOW.sow_title.label("title"),
+    SOW.status,
+    SOW.risk,
+    SOW.days_before_expiration,
+    SOW.active_sow_workers.label("active_workers"),
+    SOW.latest_maximum_budget,
+    SOW.currency,
+)
+ANALYZE_BATCH_SIZE = 1000
 
 app = FastAPI(
     title="SOW Compliance Agent API",
@@ -36,20 +70,27 @@ def upload_sows(
 ) -> dict:
     """
     Recibe una lista de SOWs, los normaliza, calcula status/riesgo y
-    los inserta/actualiza en la base de datos.
-    Dispara correos SOLO para SOWs nuevos de alto riesgo (lógica en process_sow_record).
+    los inserta/actualiza en la base de datos con un único upsert masivo.
+    Dispara correos SOLO para SOWs nuevos de alto riesgo, generados en un
+    único batch del LLM al final (send_alert_emails).
     """
-    created = 0
-    updated = 0
-    sow_ids: List[str] = []
-
-    for raw in sows:
-        sow_obj, action = process_sow_record(db, raw)
-        sow_ids.append(sow_obj.sow_id)
-        if action == "created":
-            created += 1
-        else:
-            updated += 1
+    results, created_rows = bulk_upsert_sows(
+        db, [apply_default_status(raw) for raw in sows]
+    )
+    # Una sola transacción para todo el lote
+    db.commit()
+
+    sow_ids: List[str] = [sow_id for sow_id, _ in results]
+    created = sum(1 for _, action in results if action == "created")
+    updated = len(results) - created
+
+    alerts = []
+    for sow_row in created_rows:
+        alert = alert_for(sow_row, "created")
+        if alert is not None:
+            alerts.append(alert)
+
+    send_alert_emails(alerts)
 
     return {
         "message": "Dataset procesado correctamente",
@@ -60,31 +101,36 @@ def upload_sows(
     }
 
 
+def _stream_analyze() -> Iterator[bytes]:
+    """
+    Genera el JSON de /analyze por partes: lee los SOWs en lotes de
+    ANALYZE_BATCH_SIZE filas (yield_per) y serializa cada lote con orjson,
+    así la memoria no crece con el tamaño de la tabla.
+    El total se emite al final, cuando ya se conoce.
+    """
+    # Sesión propia: el generador se consume después de que el endpoint retorna
+    db = SessionLocal()
+    try:
+        stmt = select(*ANALYZE_COLUMNS).execution_options(yield_per=ANALYZE_BATCH_SIZE)
+        total = 0
+        yield b'{"items":['
+        for batch in db.execute(stmt).mappings().partitions():
+            chunk = b",".join(orjson.dumps(dict(row)) for row in batch)
+            yield chunk if total == 0 else b"," + chunk
+            total += len(batch)
+        yield b'],"total":' + str(total).encode() + b"}"
+    finally:
+        db.close()
+
+
 @app.get("/analyze")
-def analyze_sows(db: Session = Depends(get_db)) -> dict:
+def analyze_sows() -> StreamingResponse:
     """
-    Devuelve todos los SOWs almacenados con su nivel de riesgo y status.
+    Devuelve todos los SOWs almacenados con su nivel de riesgo y status
+    ({"items": [...], "total": N}, enviado en streaming).
     Este endpoint alimenta el dashboard.
     """
-    sows = db.query(SOW).all()
-    items = []
-
-    for sow in sows:
-        items.append(
-            {
-                "sow_id": sow.sow_id,
-                "contract_id": sow.contract_id,
-                "title": sow.sow_title,
-                "status": sow.status,
-                "risk": sow.risk,
-                "days_before_expiration": sow.days_before_expiration,
-                "active_workers": sow.active_sow_workers,
-                "latest_maximum_budget": sow.latest_maximum_budget,
-                "currency": sow.currency,
-            }
-        )
-
-    return {"total": len(items), "items": items}
+    return StreamingResponse(_stream_analyze(), media_type="application/json")
 
 
 @app.post("/generate-email/{sow_id}")
@@ -100,43 +146,16 @@ def generate_email(
     if sow_obj is None:
         raise HTTPException(status_code=404, detail="SOW no encontrado")
 
-    sow_json = {
-        "sow_id": sow_obj.sow_id,
-        "sow_title": sow_obj.sow_title,
-        "sow_status": sow_obj.sow_status,
-        "risk": sow_obj.risk,
-        "status": sow_obj.status,
-        "supplier": sow_obj.supplier,
-        "business_unit": sow_obj.business_unit,
-        "primary_lob": sow_obj.primary_lob,
-        "sow_owner": sow_obj.sow_owner,
-        "start_date": sow_obj.start_date.isoformat() if sow_obj.start_date else None,
-        "end_date": sow_obj.end_date.isoformat() if sow_obj.end_date else None,
-        "latest_maximum_budget": sow_obj.latest_maximum_budget,
-        "currency": sow_obj.currency,
-    }
-
-    # Reutilizamos la misma cadena LLM que en process_sow_record
-    llm_response = email_chain.invoke({"sow_json": json.dumps(sow_json, default=str)})
-
-    try:
-        content = llm_response.content
-    except AttributeError:
-        content = str(llm_response)
-
-    try:
-        email_data = json.loads(content)
-        subject = email_data.get("subject", f"High Risk SOW: {sow_obj.sow_id}")
-        body = email_data.get("body", content)
-    except json.JSONDecodeError:
-        subject = f"High Risk SOW: {sow_obj.sow_id}"
-        body = content
+    # Misma cadena LLM y mismo payload que las alertas de /upload; el
+    # payload se serializa con orjson (fechas nativas, claves ordenadas)
+    llm_response = _EMAIL_CHAIN.invoke(_PROMPT_INPUT(sow_obj))
+    subject, body = _PARSE_EMAIL(response_content(llm_response), sow_obj.sow_id)
 
-    send_email(subject, body, ALERT_EMAIL_TO)
+    _SEND(subject, body, _TO)
 
     return {
         "message": "Email generado y enviado",
         "sow_id": sow_obj.sow_id,
         "subject": subject,
-        "to": ALERT_EMAIL_TO,
+        "to": _TO,
     }
@@ -1 +1,54 @@
-# Carga modelo y clasifica
\ No newline at end of file
+# Carga modelo y clasifica
+import os
+import sys
+from functools import lru_cache
+
+import joblib
+import numpy as np
+
+MODELS_DIR = os.getenv("MODELS_DIR", "/app/models")
+
+# Los objetos guardados por train/ se deserializan con sus módulos
+# (feature_engineering, train_criticality_model); sus dependencias de
+# inferencia están en serve/requirements.txt
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "train"))
+
+
+@lru_cache(maxsize=1)
+def load_feature_engineer(path: str = os.path.join(MODELS_DIR, "feature_engineer.pkl")):
+    """
+    Carga el SOWFeatureEngineering ajustado en el entrenamiento.
+    Se guarda sin compresión, así con mmap_mode='r' sus arrays de numpy se
+    mapean desde el archivo en vez de copiarse: los workers comparten las
+    mismas páginas vía page cache.
+    """
+    return joblib.load(path, mmap_mode="r")
+
+
+@lru_cache(maxsize=1)
+def load_classifier(path: str = os.path.join(MODELS_DIR, "criticality_model.pkl")):
+    """Carga el CriticalityClassifier entrenado (una vez por proceso)."""
+    from train_criticality_model import CriticalityClassifier
+
+    return CriticalityClassifier.load_model(path)
+
+
+def predict_criticality(df):
+    """Clasifica la criticidad de un DataFrame de SOWs crudos (columnas del CSV)."""
+    fe = load_feature_engineer()
+    X, _, _ = fe.prepare_for_training(df, fit=False)
+    return load_classifier().predict_fast(X)
+
+
+if __name__ == "__main__":
+    # Smoke check de los artefactos publicados: clasifica el dataset de ejemplo
+    # (MODELS_DIR=models python serve/predictor.py desde la raíz del proyecto)
+    from feature_engineering import read_sows, resolve_sows_path
+
+    data_dir = os.getenv("DATA_DIR", os.path.join(os.path.dirname(MODELS_DIR), "data"))
+    df = read_sows(resolve_sows_path(os.path.join(data_dir, "synthetic_sows_fieldglass.parquet")))
+    predictions = predict_criticality(df)
+    assert len(predictions) == len(df)
+    print(f"{len(predictions)} SOWs clasificados")
+    labels, counts = np.unique(predictions, return_counts=True)
+    print(dict(zip(labels.tolist(), counts.tolist())))
@@ -0,0 +1,43 @@
+# conftest.py
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import SOW  # noqa: F401
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sows.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def make_raw_sows(n: int, risk: str = "low") -> list:
+    """n SOWs crudos con las claves del CSV."""
+    return [
+        {
+            "SOW ID": f"SOW-{i:06d}",
+            "# Days before expiration": 120,
+            "SOW Status": "Active",
+            "SOW title": "Data Platform",
+            "Contract Id": f"C-{i}",
+            "Active SOW workers": 3,
+            "Start Date": "2024-01-01",
+            "End date": "2025-01-01",
+            "Latest maximum budget": 100000.0,
+            "currency": "USD",
+            "supplier": "Acme",
+            "Business Unit": "IT",
+            "Primary LOB": "Software",
+            "SOW owner": "J. Doe",
+            "risk": risk,
+        }
+        for i in range(n)
+    ]
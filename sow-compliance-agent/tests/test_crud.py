@@ -0,0 +1,47 @@
+# test_crud.py
+from sqlalchemy import func, select
+
+from app.crud import bulk_upsert_sows
+from app.main import apply_default_status
+from app.models import SOW
+
+from conftest import make_raw_sows
+
+# More rows than SQLite's bound-parameter limit (32766) allows in a single
+# IN (...) or multi-row INSERT
+LARGE_UPLOAD = 40_000
+
+
+def test_bulk_upsert_large_upload_creates_then_updates(db):
+    raw = [apply_default_status(r) for r in make_raw_sows(LARGE_UPLOAD)]
+
+    results, created = bulk_upsert_sows(db, raw)
+    db.commit()
+
+    assert len(results) == LARGE_UPLOAD
+    assert all(action == "created" for _, action in results)
+    assert len(created) == LARGE_UPLOAD
+    assert db.scalar(select(func.count()).select_from(SOW)) == LARGE_UPLOAD
+
+    # Same ids again: every row goes through the chunked pre-select + UPDATE
+    raw = [apply_default_status(r) for r in make_raw_sows(LARGE_UPLOAD, risk="high")]
+    results, created = bulk_upsert_sows(db, raw)
+    db.commit()
+
+    assert all(action == "updated" for _, action in results)
+    assert created == []
+    assert db.scalar(select(func.count()).where(SOW.risk == "high")) == LARGE_UPLOAD
+    assert db.scalar(select(func.count()).where(SOW.status == "flagged")) == LARGE_UPLOAD
+
+
+def test_bulk_upsert_duplicate_ids_in_batch(db):
+    raw = make_raw_sows(3)
+    raw.append({**raw[0], "risk": "high", "status": "flagged"})
+
+    results, created = bulk_upsert_sows(db, [apply_default_status(r) for r in raw])
+    db.commit()
+
+    assert [action for _, action in results] == ["created"] * 3 + ["updated"]
+    assert len(created) == 3
+    sow = db.scalars(select(SOW).where(SOW.sow_id == "SOW-000000")).one()
+    assert (sow.risk, sow.status) == ("high", "flagged")
@@ -0,0 +1,27 @@
+# test_serve_upload.py
+from fastapi.testclient import TestClient
+
+from app.database import get_db
+from serve import app as serve_app
+
+from conftest import make_raw_sows
+
+LARGE_UPLOAD = 40_000
+
+
+def test_upload_large_batch(db, monkeypatch):
+    # Sin LLM/SMTP: las alertas se descartan
+    monkeypatch.setattr(serve_app, "send_alert_emails", lambda alerts: None)
+    serve_app.app.dependency_overrides[get_db] = lambda: db
+    try:
+        response = TestClient(serve_app.app).post(
+            "/upload", json=make_raw_sows(LARGE_UPLOAD)
+        )
+    finally:
+        serve_app.app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total_received"] == LARGE_UPLOAD
+    assert body["created"] == LARGE_UPLOAD
+    assert body["updated"] == 0
@@ -5,18 +5,163 @@ Este script transforma los datos del CSV en features útiles para ML
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder, StandardScaler
+import polars as pl
+try:
+    from numba import njit, prange
+except ImportError:  # plataformas sin wheel de numba: se usa el camino numexpr
+    njit = None
+    import numexpr as ne  # opcional, sólo para este fallback
+from sklearn.preprocessing import StandardScaler
 from datetime import datetime
+from pathlib import Path
+import hashlib
+import re
+import shutil
+import joblib
 import warnings
 #warnings.filterwarnings('ignore')
 
+def _compute_features_numexpr(days, workers, budget):
+    """
+    Misma salida que _compute_features, evaluando cada expresión con numexpr
+    (por bloques del tamaño de la caché, multihilo y sin materializar los
+    temporales intermedios). Se usa cuando numba no está disponible.
+    """
+    env = {'days': days, 'workers': workers, 'budget': budget}
+    
+    # 1. Features temporales
+    is_expired = ne.evaluate('days < 0', local_dict=env).astype(np.int8)
+    is_critical_window = ne.evaluate('days <= 30', local_dict=env).astype(np.int8)
+    is_high_priority_window = ne.evaluate('(days > 30) & (days <= 60)', local_dict=env).astype(np.int8)
+    
+    # 2. Features de workers
+    has_workers = ne.evaluate('workers > 0', local_dict=env).astype(np.int8)
+    env['crit'] = is_critical_window
+    env['hw'] = has_workers
+    worker_criticality_score = ne.evaluate('workers * crit', local_dict=env).astype(np.int32)
+    
+    # 3. Features de budget (normalizado)
+    budget_normalized = ne.evaluate('budget / 1000000', local_dict=env).astype(np.float32)
+    budget_per_worker = ne.evaluate('where(workers > 0, budget / workers, 0.0)', local_dict=env).astype(np.float32)
+    
+    # 4. Ratios y scores compuestos
+    risk_score = ne.evaluate('(30 - days) * hw * (1.0 + log1p(workers))', local_dict=env).astype(np.float32)
+    
+    return (
+        is_expired,
+        is_critical_window,
+        is_high_priority_window,
+        has_workers,
+        worker_criticality_score,
+        budget_normalized,
+        budget_per_worker,
+        risk_score,
+    )
+
+
+# Etiquetas de criticidad indexadas por su código (0 = más crítico)
+CRIT_LABELS = np.array(['CRÍTICO', 'ALTO', 'MEDIO', 'BAJO'])
+
+
+def _classify_criticality_numpy(days, workers):
+    """
+    Códigos de criticidad (índices de CRIT_LABELS) con máscaras de NumPy.
+    Se usa cuando numba no está disponible.
+    """
+    crit = (days <= 30) & (workers > 0)
+    high = ((days <= 30) & (workers == 0)) | ((days >= 31) & (days <= 60) & (workers > 5))
+    med = (days >= 31) & (days <= 90)
+    return np.select([crit, high, med], [0, 1, 2], default=3).astype(np.int8)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _compute_features(days, workers, budget):
+        """
+        Calcula todas las features numéricas derivadas en una sola pasada
+        (kernel fusionado con Numba, en paralelo sobre las filas) en lugar de
+        una pasada + un array temporal por cada operación de pandas.
+        
+        Las salidas se escriben ya con el dtype más chico que las representa
+        (int8 para flags, float32 para ratios); se calcula en float64.
+        """
+        n = days.shape[0]
+        is_expired = np.empty(n, dtype=np.int8)
+        is_critical_window = np.empty(n, dtype=np.int8)
+        is_high_priority_window = np.empty(n, dtype=np.int8)
+        has_workers = np.empty(n, dtype=np.int8)
+        worker_criticality_score = np.empty(n, dtype=np.int32)
+        budget_normalized = np.empty(n, dtype=np.float32)
+        budget_per_worker = np.empty(n, dtype=np.float32)
+        risk_score = np.empty(n, dtype=np.float32)
+    
+        for i in prange(n):
+            d = days[i]
+            w = workers[i]
+            b = budget[i]
+        
+            # 1. Features temporales
+            is_expired[i] = 1 if d < 0 else 0
+            crit = 1 if d <= 30 else 0
+            is_critical_window[i] = crit
+            is_high_priority_window[i] = 1 if (d > 30 and d <= 60) else 0
+        
+            # 2. Features de workers
+            hw = 1 if w > 0 else 0
+            has_workers[i] = hw
+            worker_criticality_score[i] = w * crit
+        
+            # 3. Features de budget (normalizado)
+            budget_normalized[i] = b / 1_000_000
+            budget_per_worker[i] = b / w if w > 0 else 0.0
+        
+            # 4. Ratios y scores compuestos
+            risk_score[i] = (30 - d) * hw * (1.0 + np.log1p(w))
+    
+        return (
+            is_expired,
+            is_critical_window,
+            is_high_priority_window,
+            has_workers,
+            worker_criticality_score,
+            budget_normalized,
+            budget_per_worker,
+            risk_score,
+        )
+
+    @njit(parallel=True, cache=True)
+    def _classify_criticality(days, workers):
+        """
+        Códigos de criticidad (índices de CRIT_LABELS) en una sola pasada
+        nativa sobre los arrays de días y workers, sin strings intermedios.
+        """
+        n = days.shape[0]
+        out = np.empty(n, dtype=np.int8)
+        for i in prange(n):
+            d = days[i]
+            w = workers[i]
+            if d <= 30 and w > 0:
+                out[i] = 0      # CRÍTICO
+            elif d <= 30 or (d <= 60 and w > 5):
+                out[i] = 1      # ALTO
+            elif d <= 90:
+                out[i] = 2      # MEDIO
+            else:
+                out[i] = 3      # BAJO
+        return out
+else:
+    _compute_features = _compute_features_numexpr
+    _classify_criticality = _classify_criticality_numpy
+
+
 class SOWFeatureEngineering:
     """
     Clase para manejar el feature engineering de SOWs
     """
     
     def __init__(self):
-        self.label_encoders = {}
+        # Diccionario {valor: código} por columna categórica, construido en el fit
+        self.maps_ = {}
         self.scaler = StandardScaler()
         
     def create_criticality_label(self, df):
@@ -29,70 +174,62 @@ class SOWFeatureEngineering:
         - MEDIO: 61-90 días O 31-60 días con pocos workers
         - BAJO: >90 días
         """
-        def classify(row):
-            days = row['# Days before expiration']
-            workers = row['Active SOW workers']
-            
-            # CRÍTICO: próximo a expirar con workers
-            if days <= 30 and workers > 0:
-                return 'CRÍTICO'
-            
-            # ALTO: próximo a expirar sin workers, o mediano plazo con muchos workers
-            elif (days <= 30 and workers == 0) or (31 <= days <= 60 and workers > 5):
-                return 'ALTO'
-            
-            # MEDIO: mediano plazo
-            elif 31 <= days <= 90:
-                return 'MEDIO'
-            
-            # BAJO: largo plazo
-            else:
-                return 'BAJO'
+        days = df['# Days before expiration'].to_numpy(dtype=np.int64)
+        workers = df['Active SOW workers'].to_numpy(dtype=np.int64)
         
-        df['Criticality'] = df.apply(classify, axis=1)
+        # Código entero por fila (ver _classify_criticality) y su etiqueta
+        codes = _classify_criticality(days, workers)
+        df['Criticality_code'] = codes
+        df['Criticality'] = CRIT_LABELS[codes]
         return df
     
     def engineer_features(self, df):
         """
         Crea features derivadas útiles para el modelo
+        
+        No modifica `df`: trabaja sobre una copia superficial (comparte los
+        buffers de las columnas existentes) y solo agrega columnas nuevas.
         """
-        df = df.copy()
-        
-        # 1. Features temporales
-        df['days_to_expire'] = df['# Days before expiration']
-        df['is_expired'] = (df['days_to_expire'] < 0).astype(int)
-        df['is_critical_window'] = (df['days_to_expire'] <= 30).astype(int)
-        df['is_high_priority_window'] = ((df['days_to_expire'] > 30) & 
-                                         (df['days_to_expire'] <= 60)).astype(int)
-        
-        # 2. Features de workers
-        df['has_workers'] = (df['Active SOW workers'] > 0).astype(int)
-        df['worker_count'] = df['Active SOW workers']
-        df['worker_criticality_score'] = df['worker_count'] * df['is_critical_window']
-        
-        # 3. Features de budget (normalizado)
-        df['budget_normalized'] = df['Latest maximum budget'] / 1_000_000  # En millones
-        df['budget_per_worker'] = np.where(
-            df['worker_count'] > 0,
-            df['Latest maximum budget'] / df['worker_count'],
-            0
-        )
+        df = df.copy(deep=False)
         
-        # 4. Ratios y scores compuestos
-        df['risk_score'] = (
-            (30 - df['days_to_expire']) * df['has_workers'] * 
-            (1 + np.log1p(df['worker_count']))
-        )
+        # 1-4. Features temporales, de workers, de budget y scores compuestos,
+        # calculados en un solo kernel (ver _compute_features)
+        days = df['# Days before expiration'].to_numpy(dtype=np.int64)
+        workers = df['Active SOW workers'].to_numpy(dtype=np.int64)
+        budget = df['Latest maximum budget'].to_numpy(dtype=np.float64)
+        
+        (
+            is_expired,
+            is_critical_window,
+            is_high_priority_window,
+            has_workers,
+            worker_criticality_score,
+            budget_normalized,
+            budget_per_worker,
+            risk_score,
+        ) = _compute_features(days, workers, budget)
+        
+        df['days_to_expire'] = days.astype(np.int32)
+        df['is_expired'] = is_expired
+        df['is_critical_window'] = is_critical_window
+        df['is_high_priority_window'] = is_high_priority_window
+        df['has_workers'] = has_workers
+        df['worker_count'] = workers.astype(np.int16)
+        df['worker_criticality_score'] = worker_criticality_score
+        df['budget_normalized'] = budget_normalized  # En millones
+        df['budget_per_worker'] = budget_per_worker
+        df['risk_score'] = risk_score
         
-        # 5. Features categóricas - Label Encoding
+        # 5. Features categóricas - Label Encoding con un dict por columna
+        # (Series.map hace un lookup en la hash table en C por valor; códigos
+        # en orden alfabético igual que LabelEncoder). Valores no vistos en
+        # el fit quedan con código -1.
         categorical_cols = ['supplier', 'Business Unit', 'Primary LOB', 'currency']
         
         for col in categorical_cols:
-            if col not in self.label_encoders:
-                self.label_encoders[col] = LabelEncoder()
-                df[f'{col}_encoded'] = self.label_encoders[col].fit_transform(df[col].astype(str))
-            else:
-                df[f'{col}_encoded'] = self.label_encoders[col].transform(df[col].astype(str))
+            if col not in self.maps_:
+                self.maps_[col] = {v: i for i, v in enumerate(sorted(df[col].dropna().unique()))}
+            df[f'{col}_encoded'] = df[col].map(self.maps_[col]).fillna(-1).astype(np.int16)
         
         return df
     
@@ -117,9 +254,12 @@ class SOWFeatureEngineering:
             'currency_encoded'
         ]
     
-    def prepare_for_training(self, df):
+    def prepare_for_training(self, df, fit=True):
         """
         Prepara el dataset completo para entrenamiento
+        
+        Con fit=True ajusta el scaler sobre estos datos; con fit=False reutiliza
+        el scaler ya ajustado (evaluación / inferencia, sin leakage).
         """
         # Crear etiquetas de criticidad
         df = self.create_criticality_label(df)
@@ -132,24 +272,134 @@ class SOWFeatureEngineering:
         X = df[feature_cols]
         y = df['Criticality']
         
-        #Normalizar features numéricas (opcional pero recomendado)
-        X_scaled = self.scaler.fit_transform(X)
+        #Normalizar features numéricas (opcional pero recomendado).
+        # float32 basta para estas features y reduce a la mitad la memoria
+        X_values = X.to_numpy(dtype=np.float32)
+        if fit:
+            X_scaled = self.scaler.fit_transform(X_values)
+        else:
+            X_scaled = self.scaler.transform(X_values)
         X = pd.DataFrame(X_scaled, columns=feature_cols)
         
         return X, y, df
 
 
-def load_and_prepare_data(csv_path='/app/data/synthetic_sows_fieldglass.csv'):
+# Tipos fijos de las columnas numéricas al leer el CSV (los mismos que
+# escribe el generador en el Parquet)
+CSV_SCHEMA_OVERRIDES = {
+    '# Days before expiration': pl.Int32,
+    'Active SOW workers': pl.Int16,
+    'Latest maximum budget': pl.Int64,
+}
+
+
+def resolve_sows_path(path):
     """
-    Carga el CSV y prepara los datos para entrenamiento
+    Ruta real del dataset: el .parquet pedido o, si no existe, el .csv
+    con el mismo nombre
     """
-    print(" Cargando datos...")
-    df = pd.read_csv(csv_path)
-    print(f"   ✓ {len(df)} registros cargados")
+    path = Path(path)
+    if path.suffix == '.parquet' and not path.exists() and path.with_suffix('.csv').exists():
+        return path.with_suffix('.csv')
+    return path
+
+
+def read_sows(path):
+    """
+    Lee el dataset de SOWs. Parquet (columnar y tipado, no hay que re-inferir
+    dtypes) si la ruta es .parquet; CSV en cualquier otro caso.
+    Si el .parquet no existe pero hay un .csv con el mismo nombre, usa el CSV.
+    
+    El CSV se lee con polars (parser multihilo, tipos fijados y fechas
+    parseadas en el mismo plan) y se pasa a pandas solo al final, porque el
+    feature engineering trabaja sobre DataFrames de pandas.
+    """
+    path = resolve_sows_path(path)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path, engine='pyarrow')
     
-    print("\n Aplicando feature engineering...")
-    fe = SOWFeatureEngineering()
-    X, y, df_processed = fe.prepare_for_training(df)
+    lf = (
+        pl.scan_csv(path, schema_overrides=CSV_SCHEMA_OVERRIDES, try_parse_dates=True)
+        .with_columns(pl.col(pl.Date).cast(pl.Datetime('ns')))
+    )
+    return lf.collect().to_pandas()
+
+
+# Subdirectorio de cache_dir con los datasets preparados (cache_dir puede
+# compartirse con otras cachés, p. ej. la de cross_validate) y nombre de sus
+# entradas: hash de 16 hex, o .<hash>.tmp mientras se escribe
+PREPARED_CACHE_SUBDIR = 'prepared'
+_CACHE_ENTRY_RE = re.compile(r'\.?[0-9a-f]{16}(\.tmp)?')
+
+
+def _dataset_cache_key(path):
+    """
+    Hash de la ruta, mtime y tamaño del dataset (y del mtime de este módulo,
+    para que un cambio en el feature engineering también invalide la caché)
+    """
+    st = path.stat()
+    module_mtime = Path(__file__).stat().st_mtime_ns
+    raw = f"{path.resolve()}|{st.st_mtime_ns}|{st.st_size}|{module_mtime}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _load_cached(cache_entry):
+    """Lee (X, y, df_processed, fe) de una entrada de la caché"""
+    X = pd.read_parquet(cache_entry / 'X.parquet')
+    df_processed = pd.read_parquet(cache_entry / 'df_processed.parquet')
+    fe = joblib.load(cache_entry / 'fe.joblib')
+    return X, df_processed['Criticality'], df_processed, fe
+
+
+def _save_cached(cache_entry, X, df_processed, fe):
+    """
+    Escribe una entrada de la caché (en un directorio temporal que luego se
+    renombra) y borra las entradas viejas, que ya no corresponden al dataset.
+    Sólo se borran directorios con nombre de entrada (_CACHE_ENTRY_RE).
+    """
+    cache_dir = cache_entry.parent
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for old in cache_dir.iterdir():
+        if old.is_dir() and _CACHE_ENTRY_RE.fullmatch(old.name):
+            shutil.rmtree(old, ignore_errors=True)
+    
+    tmp = cache_dir / f'.{cache_entry.name}.tmp'
+    tmp.mkdir()
+    X.to_parquet(tmp / 'X.parquet', engine='pyarrow')
+    df_processed.to_parquet(tmp / 'df_processed.parquet', engine='pyarrow')
+    joblib.dump(fe, tmp / 'fe.joblib')
+    tmp.rename(cache_entry)
+
+
+def load_and_prepare_data(csv_path='/app/data/synthetic_sows_fieldglass.parquet', cache_dir=None):
+    """
+    Carga el dataset (Parquet o CSV) y prepara los datos para entrenamiento
+    
+    Si se pasa `cache_dir`, el resultado (X, y, df_processed, fe) se guarda
+    en `cache_dir/prepared` indexado por el hash de mtime+tamaño del dataset,
+    y las corridas siguientes con el mismo archivo lo leen directo de la caché.
+    """
+    path = resolve_sows_path(csv_path)
+    cache_entry = (
+        Path(cache_dir) / PREPARED_CACHE_SUBDIR / _dataset_cache_key(path)
+        if cache_dir else None
+    )
+    
+    if cache_entry is not None and cache_entry.exists():
+        print(" Cargando datos preparados desde caché...")
+        X, y, df_processed, fe = _load_cached(cache_entry)
+        print(f"   ✓ {len(X)} registros cargados ({cache_entry})")
+    else:
+        print(" Cargando datos...")
+        df = read_sows(path)
+        print(f"   ✓ {len(df)} registros cargados")
+        
+        print("\n Aplicando feature engineering...")
+        fe = SOWFeatureEngineering()
+        X, y, df_processed = fe.prepare_for_training(df)
+        
+        if cache_entry is not None:
+            _save_cached(cache_entry, X, df_processed, fe)
     
     print(f"   {X.shape[1]} features creadas")
     print(f"   Target variable: {y.name}")
@@ -192,7 +442,7 @@ if __name__ == "__main__":
     print("=" * 60)
     
     # Cargar y preparar datos
-    X, y, df_processed, fe = load_and_prepare_data('synthetic_sows_fieldglass.csv')
+    X, y, df_processed, fe = load_and_prepare_data('synthetic_sows_fieldglass.parquet')
     
     # Explorar features
     df_analysis = explore_features(X, y)